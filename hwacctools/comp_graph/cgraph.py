@@ -54,8 +54,10 @@ class Cgraph(object):
         Obtains a `cgraph` from an ONNX model loaded in.
         '''
         node_list = []
+        # Builders only look names up in the model, index it once for all of them
+        nx_index = onnx_utils.index_model(nx_model)
         for node in nx_model.graph.node:
-            a = cnodes.get_cnode_from_onnx_node(node, nx_model, channel_minor=True)
+            a = cnodes.get_cnode_from_onnx_node(node, nx_index, channel_minor=True)
             if type(a) == list:
                 node_list.extend(a)
             else:
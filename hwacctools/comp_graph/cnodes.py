@@ -910,7 +910,7 @@ class gemm_node(Node):
         return out.astype(input.dtype)
     
 class toeplitzizer_node(Node):
-    def __init__(self, inputs:list[str], outputs:list[str], ksize:int, strides:int = 1):
+    def __init__(self, inputs:list[str], outputs:list[str], ksize:int, strides:int = 1, channel_minor = False, zero_point = 0):
         '''
         Creates a node that transforms the input into a flattened toeplitz
         matrix at the output
@@ -918,6 +918,8 @@ class toeplitzizer_node(Node):
         super(toeplitzizer_node,self).__init__(inputs,outputs)
         self.ksize = ksize
         self.strides = strides
+        self.channel_minor = channel_minor
+        self.zero_point = zero_point
         
     def forward(self,input:np.array):
         '''
@@ -926,7 +928,7 @@ class toeplitzizer_node(Node):
         input: vector
         '''
         input = np.array(input[0]).squeeze(axis=0)
-        out = toeplitzize_input(input,ksize=self.ksize,strides=self.strides)
+        out = toeplitzize_input(input,ksize=self.ksize,strides=self.strides,channel_minor=self.channel_minor,zero_point=self.zero_point)
         return out
     
 class channel_slicing_node(Node):
@@ -952,13 +954,15 @@ class channel_slicing_node(Node):
         return input_cwh_sliced
     
 class slicer_node(Node):
-    def __init__(self, inputs:list[str], outputs:list[str], starts, ends):
+    def __init__(self, inputs:list[str], outputs:list[str], starts = None, ends = None, col_lim = None):
         '''
         Creates a node that slices the input array according to the slicing defined by starts and ends.
+        If col_lim = [low, high] is given instead, only the last axis is sliced.
         '''
         super(slicer_node,self).__init__(inputs,outputs)
         self.starts = starts
         self.ends = ends
+        self.col_lim = col_lim
 
     @classmethod 
     def from_onnx_node(self,onnx_model,onnx_node):
@@ -976,6 +980,9 @@ class slicer_node(Node):
 
     def forward(self,input:np.array):
         input = np.array(input).squeeze(axis=0)
+
+        if self.col_lim is not None:
+            return input[...,self.col_lim[0]:self.col_lim[1]]
         
         # Create slice objects for each dimension
         slices = tuple(slice(start, end) for start, end in zip(self.starts, self.ends))
@@ -1,11 +1,70 @@
 import numpy as np
 
-def get_recfield_for_pixel(r,c,matrix,ksize):
-    'Obtains the receptive field for a convolution output pixel'
-    if ksize == 1:
-        return matrix[r,c]
-    if ksize == 3:
-        return matrix[r:r+3,c:c+3].transpose(2,0,1)
+try:
+    from numba import njit
+except ImportError:
+    # numba is optional, int8 tensors fall back to the NumPy im2col
+    njit = None
+
+# Working set budget for one band of output rows, roughly an L2
+_TILE_BYTES = 256*1024
+
+def _make_toeplitz_kernel(K):
+    '''
+    Returns a kernel that writes output rows r0:r1 of the KxK im2col of an
+    H,W,C tensor directly into out. K is baked in so the ky,kx loops have
+    constant trip counts. Out-of-bounds reads are replaced by zero_point,
+    so no padded copy is made.
+    '''
+    KK = K*K
+
+    def kernel(tensor, out, r0, r1, W, C, stridesy, stridesx, pad_top, pad_left, zero_point, channel_minor):
+        Hin = tensor.shape[0]
+        Win = tensor.shape[1]
+        for r in range(r0,r1):
+            for c in range(W):
+                row = r*W + c
+                # Loop order follows the column layout so writes stay contiguous
+                if channel_minor:
+                    for ky in range(K):
+                        ry = r*stridesy + ky - pad_top
+                        for kx in range(K):
+                            rx = c*stridesx + kx - pad_left
+                            col = (ky*K + kx)*C
+                            if ry >= 0 and ry < Hin and rx >= 0 and rx < Win:
+                                for ch in range(C):
+                                    out[row,col+ch] = tensor[ry,rx,ch]
+                            else:
+                                for ch in range(C):
+                                    out[row,col+ch] = zero_point
+                else:
+                    for ch in range(C):
+                        for ky in range(K):
+                            ry = r*stridesy + ky - pad_top
+                            for kx in range(K):
+                                rx = c*stridesx + kx - pad_left
+                                col = ch*KK + ky*K + kx
+                                if ry >= 0 and ry < Hin and rx >= 0 and rx < Win:
+                                    out[row,col] = tensor[ry,rx,ch]
+                                else:
+                                    out[row,col] = zero_point
+
+    if njit is not None:
+        kernel = njit(cache=True)(kernel)
+    return kernel
+
+# Square kernel sizes with a compiled im2col, picked once per layer.
+# 1x1 needs no gather and is a strided copy in toeplitzize_input.
+_KERNELS = {K: _make_toeplitz_kernel(K) for K in (3,5,7)}
+
+def _valid_range(n_out, start, stride, n_in):
+    '''
+    Returns the [a,b) range of output indices i for which start + i*stride
+    falls inside an input axis of length n_in.
+    '''
+    a = max(0, (stride - 1 - start) // stride)
+    b = min(n_out, (n_in - start + stride - 1) // stride)
+    return a, max(a,b)
 
 def toeplitzize_input(in_tensor,ksize=3,strides=1,channel_minor = False, zero_point = 0, pads = (1,1,1,1), kernel_shape = None):
     '''
@@ -21,7 +80,6 @@ def toeplitzize_input(in_tensor,ksize=3,strides=1,channel_minor = False, zero_po
 
     #Convert to B,H,W,C tensor
     tensor = in_tensor.transpose(1,2,0)
-    ifmap_shape = tensor.shape
 
     if type(strides) is int:
         stridesx = strides
@@ -30,26 +88,56 @@ def toeplitzize_input(in_tensor,ksize=3,strides=1,channel_minor = False, zero_po
         stridesx = strides[0]
         stridesy = strides[1]
 
+    C = tensor.shape[2]
+
+    if ksize == 1:
+        # Pointwise, no receptive field to gather
+        return np.ascontiguousarray(tensor[::stridesy,::stridesx]).reshape(-1,C)
+
     H = (tensor.shape[0] - kernel_shape[0] + 2 * pads[0]) // stridesx + 1
     W = (tensor.shape[1] - kernel_shape[1] + 2 * pads[1]) // stridesy + 1
-    C = tensor.shape[2] 
 
-    firstpad = (pads[0], pads[1])
-    secondpad = (pads[2], pads[3])
+    # Keep the output and the padding value in the input dtype, so 8-bit
+    # activations are never widened on their way to the matmul
+    out = np.empty((H*W,C*kernel_shape[0]*kernel_shape[1]), dtype=tensor.dtype, order='C')
+    zp = np.asarray(zero_point).astype(tensor.dtype)
+
+    if out.size == 0:
+        return out
 
-    if ksize == 3:
-        tensor2 = np.pad(tensor,(firstpad,secondpad,(0,0)), 
-                         mode='constant', constant_values=zero_point)
-        out = np.empty((H*W,C*9), dtype=tensor.dtype)
+    # Rows of output pixels per band so that each band stays in cache
+    Tr = max(1, _TILE_BYTES // (W*out.shape[1]*tensor.dtype.itemsize))
+
+    kernel = _KERNELS.get(kernel_shape[0]) if kernel_shape[0] == kernel_shape[1] else None
+    if njit is not None and tensor.dtype.itemsize == 1 and kernel is not None:
+        for r0 in range(0,H,Tr):
+            kernel(tensor, out, r0, min(r0+Tr,H), W, C, stridesy, stridesx, pads[0], pads[2], zp.item(), channel_minor)
+        return out
+
+    # Same gather as the kernel above, one (Fy,Fx) tap at a time. Reads that
+    # fall in the padding are written as zp instead of padding a copy.
+    Hin, Win = tensor.shape[:2]
+    if channel_minor:
+        out_taps = out.reshape(H,W,*kernel_shape,C)
     else:
-        tensor2 = tensor
-        out = np.empty((H*W,C), dtype=tensor.dtype)
-    for r in range(H):
-        for c in range(W):
-            recfield = get_recfield_for_pixel(stridesy*r,stridesx*c,tensor2,ksize)
-            if channel_minor and ksize == 3:
-                out[r*W + c] = recfield.transpose(1,2,0).flatten()
-            else:
-                out[r*W + c] = recfield.flatten()
+        out_taps = out.reshape(H,W,C,*kernel_shape).transpose(0,1,3,4,2)
+
+    for r0 in range(0,H,Tr):
+        r1 = min(r0+Tr,H)
+        for ky in range(kernel_shape[0]):
+            y0 = r0*stridesy + ky - pads[0]
+            ya, yb = _valid_range(r1-r0, y0, stridesy, Hin)
+            for kx in range(kernel_shape[1]):
+                x0 = kx - pads[2]
+                xa, xb = _valid_range(W, x0, stridesx, Win)
+
+                tap = out_taps[r0:r1,:,ky,kx]
+                tap[:ya] = zp
+                tap[yb:] = zp
+                tap[:,:xa] = zp
+                tap[:,xb:] = zp
+                if ya < yb and xa < xb:
+                    tap[ya:yb,xa:xb] = tensor[y0 + ya*stridesy : y0 + (yb-1)*stridesy + 1 : stridesy,
+                                              x0 + xa*stridesx : x0 + (xb-1)*stridesx + 1 : stridesx]
 
     return out
@@ -8,31 +8,31 @@ def split_shapelist_into_chunks(shapelist,H,W):
         outlist.extend(np.array(chunk_shape_list).reshape(-1,2))
     return outlist
 
+def plan_tiles(shape,H,W):
+    '''
+    Plans the split of a matrix of the given shape into chunks of at most H,W.
+
+    Returns
+    -------
+    row_slices, col_slices : np.ndarray
+        (N,2) arrays of (start, size) for the row and column chunks
+    '''
+    rows, cols = shape
+    row_starts = np.arange(0,rows,H)
+    col_starts = np.arange(0,cols,W)
+    row_slices = np.stack([row_starts, np.minimum(H, rows-row_starts)], axis=1)
+    col_slices = np.stack([col_starts, np.minimum(W, cols-col_starts)], axis=1)
+    return row_slices, col_slices
+
 def split_shape_into_chunks(shape,H,W):
     '''
     Like split_matrix_into_chunks, but works with just shapes.
     '''
-    matrix = np.empty(shape) 
-    out = []
-    if matrix.shape[1] > W:
-        reps = matrix.shape[1]//W + (matrix.shape[1]%W!=0) #ceil func
-        for i in range(reps):
-            out.append(matrix[:,W*i:W*i+W])
-    else:
-        out.append(matrix)
-
-    out2 = []
-    for i,mat in enumerate(out):
-        out_col = []
-        if mat.shape[0] > H:
-            reps = mat.shape[0]//H + (mat.shape[0]%H!=0) #ceil func
-            for i in range(reps):
-                out_col.append(mat[H*i:H*i+H])
-        else:
-            out_col.append(mat)
-        out2.append(out_col)
+    row_slices, col_slices = plan_tiles(shape,H,W)
+    row_splits = row_slices[:,1].tolist()
+    col_splits = col_slices[:,1].tolist()
 
-    return [[i.shape for i in c] for c in out2]
+    return [[(r, c) for r in row_splits] for c in col_splits]
 
 def split_matrix_into_chunks(matrix,H,W):
     '''
@@ -48,40 +48,18 @@ def split_matrix_into_chunks(matrix,H,W):
         max width of submatrices
     '''
 
-    out = []
-    if matrix.shape[1] > W:
-        reps = matrix.shape[1]//W + (matrix.shape[1]%W!=0) #ceil func
-        for i in range(reps):
-            out.append(matrix[:,W*i:W*i+W])
-    else:
-        out.append(matrix)
-
-    out2 = []
-    for i,mat in enumerate(out):
-        out_col = []
-        if mat.shape[0] > H:
-            reps = mat.shape[0]//H + (mat.shape[0]%H!=0) #ceil func
-            for i in range(reps):
-                out_col.append(mat[H*i:H*i+H])
-        else:
-            out_col.append(mat)
-        out2.append(out_col)
-    return out2
+    # Full W,H chunks first and the remainder last, matching plan_tiles
+    cols = np.split(matrix, range(W, matrix.shape[1], W), axis=1)
+    return [np.split(col, range(H, col.shape[0], H), axis=0) for col in cols]
 
 def split_vector_into_chunks(vector : np.array, W : int):
     '''
     Split vector into chunks of at most W
     '''
 
-    if vector.shape is ():
-        # single output channel conv -> single-value bias
-        vector = np.expand_dims(vector,-1)
-
-    from itertools import zip_longest
-    b = list(zip_longest(*(iter(vector),)*W))
-    c = [np.array(i) for i in b]
-    d = [i[i != np.array(None)] for i in c]
-    return d
+    # atleast_1d handles single output channel conv -> single-value bias
+    vector = np.atleast_1d(vector)
+    return np.split(vector, range(W, vector.shape[0], W))
 
 def split_kernel_into_channels(kernel:np.ndarray,C:int):
     '''
@@ -98,37 +76,46 @@ def split_kernel_into_channels(kernel:np.ndarray,C:int):
 
     return subkernels
 
-def split_dwc_into_chunks(cnode:cnodes.dwc_node,C:int):
+def _emit_tiled_matmul_subgraph(input_edge:str,output_edge:str,base:str,col_tiles):
     '''
-    Splits a depthwise convolution node into chunks of at most C channels.
-    '''
-    subkernels = split_kernel_into_channels(cnode.kernel,C)
-    strides = cnode.strides
-
-    if len(subkernels) == 1:
-        return [cnode]
+    Emits the slicer, gemm, adder and cat nodes of a matmul split into tiles.
 
+    PARAMETERS
+    ----------
+    input_edge : str
+        edge holding the matmul input, sliced along its last axis
+    output_edge : str
+        edge that receives the concatenated output chunks
+    base : str
+        prefix for the names of the intermediate edges
+    col_tiles : iterable
+        per chunk of output columns, a (biases, row_tiles) pair where
+        row_tiles holds the (start, size, submatrix) of every chunk of
+        input columns feeding it
+
+    Output chunks are concatenated on the last axis, which holds the
+    output columns whether or not a column chunk needed an adder.
+    '''
     nodes = []
-
-    tplitz_output_edge = cnode.outputs[0] + '_tplitz'
-    tplitz_node = cnodes.toeplitzizer_node(cnode.inputs,[tplitz_output_edge],ksize=ksize,strides=strides)
-    nodes.append(tplitz_node)
-
     cat_inputs = []
 
-    for i,col in enumerate(submatrices):
+    for i,(col_biases,row_tiles) in enumerate(col_tiles):
 
         adder_inputs = []
 
-        for j,matrix in enumerate(col):
+        # Edge names only differ in j within a column, format the rest once
+        slicer_prefix = '%s_slicer_%d-' % (base,i)
+        gemm_prefix = '%s_gemm_%d-' % (base,i)
+
+        for j,(r0,rh,matrix) in enumerate(row_tiles):
 
             # In the crossbar these would be rows, but in the current orientation it's cols
-            input_cols = [H*j,H*j+H]
+            input_cols = [r0,r0+rh]
 
-            slicer_output_edge = f'{cnode.outputs[0]}_slicer_{i}-{j}'
-            slicer = cnodes.slicer_node([tplitz_output_edge],[slicer_output_edge],col_lim=input_cols)
-            
-            gemm_output_edge = f'{cnode.outputs[0]}_gemm_{i}-{j}'
+            slicer_output_edge = slicer_prefix + str(j)
+            slicer = cnodes.slicer_node([input_edge],[slicer_output_edge],col_lim=input_cols)
+
+            gemm_output_edge = gemm_prefix + str(j)
             gemm = cnodes.gemm_node([slicer_output_edge],[gemm_output_edge],matrix)
 
             nodes.append(slicer)
@@ -137,34 +124,83 @@ def split_dwc_into_chunks(cnode:cnodes.dwc_node,C:int):
             adder_inputs.append(gemm_output_edge)
 
         #apply bias to the last matrices
-        nodes[-1].biases = subbiases[i]
+        nodes[-1].biases = col_biases
 
         if len(adder_inputs) > 1:
-            adder_output_edge = f'{cnode.outputs[0]}_adder_{i}'
+            adder_output_edge = '%s_adder_%d' % (base,i)
             adder = cnodes.add_node(adder_inputs,[adder_output_edge])
             nodes.append(adder)
             cat_inputs.append(adder_output_edge)
         else:
             cat_inputs.extend(adder_inputs)
 
-    cat_output_edge = f'{cnode.outputs[0]}_cat'
-    cat = cnodes.cat_node(cat_inputs,[cat_output_edge],axis=-1)
+    cat = cnodes.cat_node(cat_inputs,[output_edge],axis=-1)
     nodes.append(cat)
 
-    C = cnode.matrix.shape[1]
+    return nodes
+
+def _plan_col_tiles(matrix,biases,row_slices,col_slices):
+    '''
+    Yields the tiles of a plan_tiles split in the form taken by
+    _emit_tiled_matmul_subgraph, slicing the matrix lazily.
+    '''
+    for c0,cw in col_slices:
+        row_tiles = ((r0,rh,matrix[r0:r0+rh,c0:c0+cw]) for r0,rh in row_slices)
+        yield biases[c0:c0+cw], row_tiles
+
+def _emit_toeplitz_matmul_subgraph(cnode,col_tiles,ksize,strides,channel_minor,from_type):
+    '''
+    Emits a toeplitzizer followed by a tiled matmul and a reshaper back to
+    a C,H,W tensor, replacing a convolution-like node.
+    '''
+    base = cnode.outputs[0]
+
+    tplitz_output_edge = base + '_tplitz'
+    tplitz_node = cnodes.toeplitzizer_node(cnode.inputs,[tplitz_output_edge],ksize=ksize,strides=strides,
+                                           channel_minor=channel_minor,zero_point=cnode.zero_point)
+    nodes = [tplitz_node]
+
+    cat_output_edge = f'{base}_cat'
+    nodes.extend(_emit_tiled_matmul_subgraph(tplitz_output_edge,cat_output_edge,base,col_tiles))
+
+    C = cnode.kernel.shape[0]
 
     output_tensorizer = cnodes.reshaper_node([cat_output_edge],cnode.outputs,channels = C)
     nodes.append(output_tensorizer)
 
-    if ksize == 1:
-        for node in nodes:
-            node.from_type = 'pointwise'
-    else:
-        for node in nodes:
-            node.from_type = 'conv'
+    for node in nodes:
+        node.from_type = from_type
 
     return nodes
 
+def split_dwc_into_chunks(cnode:cnodes.dwc_node,C:int):
+    '''
+    Splits a depthwise convolution node into chunks of at most C channels.
+
+    Each chunk is a matmul of the chunk's slice of the channel-major
+    Toeplitz input with a block-diagonal matrix holding one kernel per
+    output channel.
+    '''
+    ksize = cnode.kernel.shape[-1]
+    nchannels = cnode.kernel.shape[0]
+    window = cnode.kernel.shape[-1] * cnode.kernel.shape[-2]
+
+    if nchannels <= C:
+        return [cnode]
+
+    flat_kernel = cnode.kernel.reshape(nchannels,window)
+    biases = np.broadcast_to(cnode.biases, (nchannels,))
+
+    def col_tiles():
+        for c0 in range(0,nchannels,C):
+            cw = min(C,nchannels-c0)
+            block = np.zeros((cw,window,cw),dtype=flat_kernel.dtype)
+            block[np.arange(cw),:,np.arange(cw)] = flat_kernel[c0:c0+cw]
+            yield biases[c0:c0+cw], [(c0*window,cw*window,block.reshape(cw*window,cw))]
+
+    return _emit_toeplitz_matmul_subgraph(cnode,col_tiles(),ksize,cnode.strides,
+                                          channel_minor=False,from_type='dwc')
+
 def split_conv_into_channels(cnode:cnodes.conv_node,C:int):
 
     kernels = split_kernel_into_channels(cnode.kernel,C)
@@ -205,121 +241,31 @@ def split_conv_into_channels(cnode:cnodes.conv_node,C:int):
     return
 
 def split_conv_into_chunks(cnode:cnodes.conv_node,H:int,W:int):
-    submatrices = split_matrix_into_chunks(cnode.matrix,H,W)
-    subbiases = split_vector_into_chunks(cnode.biases,W)
+    row_slices, col_slices = plan_tiles(cnode.matrix.shape,H,W)
+    biases = np.broadcast_to(cnode.biases, cnode.matrix.shape[1:])
     ksize = cnode.kernel.shape[-1]
-    strides = cnode.strides
+    from_type = 'pointwise' if ksize == 1 else 'conv' # I don't actually remember what the from_type is for
 
-    if len(submatrices) == 1 and len(submatrices[0]) == 1:
-        if ksize == 1:
-            cnode.from_type = 'pointwise' # I don't actually remember what the from_type is for
-        else:
-            cnode.from_type = 'conv'
+    if len(row_slices) == 1 and len(col_slices) == 1:
+        cnode.from_type = from_type
         return [cnode]
 
-    nodes = []
-
-    tplitz_output_edge = cnode.outputs[0] + '_tplitz'
-    tplitz_node = cnodes.toeplitzizer_node(cnode.inputs,[tplitz_output_edge],ksize=ksize,strides=strides)
-    nodes.append(tplitz_node)
-
-    cat_inputs = []
-
-    for i,col in enumerate(submatrices):
-
-        adder_inputs = []
-
-        for j,matrix in enumerate(col):
-
-            # In the crossbar these would be rows, but in the current orientation it's cols
-            input_cols = [H*j,H*j+H]
-
-            slicer_output_edge = f'{cnode.outputs[0]}_slicer_{i}-{j}'
-            slicer = cnodes.slicer_node([tplitz_output_edge],[slicer_output_edge],col_lim=input_cols)
-            
-            gemm_output_edge = f'{cnode.outputs[0]}_gemm_{i}-{j}'
-            gemm = cnodes.gemm_node([slicer_output_edge],[gemm_output_edge],matrix)
-
-            nodes.append(slicer)
-            nodes.append(gemm)
-
-            adder_inputs.append(gemm_output_edge)
-
-        #apply bias to the last matrices
-        nodes[-1].biases = subbiases[i]
-
-        if len(adder_inputs) > 1:
-            adder_output_edge = f'{cnode.outputs[0]}_adder_{i}'
-            adder = cnodes.add_node(adder_inputs,[adder_output_edge])
-            nodes.append(adder)
-            cat_inputs.append(adder_output_edge)
-        else:
-            cat_inputs.extend(adder_inputs)
-
-    cat_output_edge = f'{cnode.outputs[0]}_cat'
-    cat = cnodes.cat_node(cat_inputs,[cat_output_edge],axis=-1)
-    nodes.append(cat)
-
-    C = cnode.matrix.shape[1]
-
-    output_tensorizer = cnodes.reshaper_node([cat_output_edge],cnode.outputs,channels = C)
-    nodes.append(output_tensorizer)
-
-    if ksize == 1:
-        for node in nodes:
-            node.from_type = 'pointwise'
-    else:
-        for node in nodes:
-            node.from_type = 'conv'
-
-    return nodes
+    col_tiles = _plan_col_tiles(cnode.matrix,biases,row_slices,col_slices)
+    return _emit_toeplitz_matmul_subgraph(cnode,col_tiles,ksize,cnode.strides,
+                                          channel_minor=cnode.channel_minor,from_type=from_type)
 
 def split_gemm_into_chunks(cnode:cnodes.gemm_node,H:int,W:int):
 
-    submatrices = split_matrix_into_chunks(cnode.matrix,H,W)
-    subbiases = split_vector_into_chunks(cnode.biases,W)
-
-    if len(submatrices) == 1:
-        if len(submatrices[0]) == 1:
-            return [cnode]
-
-    nodes = []
-
-    cat_inputs = []
-
-    for i,col in enumerate(submatrices):
-
-        adder_inputs = []
-
-        for j,matrix in enumerate(col):
-
-            # In the crossbar these would be rows, but in the current orientation it's cols
-            input_cols = [H*j,H*j+H]
-
-            slicer_output_edge = f'{cnode.outputs[0]}_slicer_{i}-{j}'
-            slicer = cnodes.slicer_node(cnode.inputs,[slicer_output_edge],col_lim=input_cols)
-            
-            gemm_output_edge = f'{cnode.outputs[0]}_gemm_{i}-{j}'
-            gemm = cnodes.gemm_node([slicer_output_edge],[gemm_output_edge],matrix)
-
-            nodes.append(slicer)
-            nodes.append(gemm)
-
-            adder_inputs.append(gemm_output_edge)
+    row_slices, col_slices = plan_tiles(cnode.matrix.shape,H,W)
+    biases = np.broadcast_to(cnode.biases, cnode.matrix.shape[1:])
 
-        #apply bias to the last matrices
-        nodes[-1].biases = subbiases[i]
-
-        adder_output_edge = f'{cnode.outputs[0]}_adder_{i}'
-        adder = cnodes.add_node(adder_inputs,[adder_output_edge])
-        nodes.append(adder)
-
-        cat_inputs.append(adder_output_edge)
+    if len(row_slices) == 1 and len(col_slices) == 1:
+        return [cnode]
 
-    cat = cnodes.cat_node(cat_inputs,cnode.outputs,axis=0)
-    nodes.append(cat)
+    col_tiles = _plan_col_tiles(cnode.matrix,biases,row_slices,col_slices)
+    nodes = _emit_tiled_matmul_subgraph(cnode.inputs[0],cnode.outputs[0],cnode.outputs[0],col_tiles)
 
     for node in nodes:
         node.from_type = 'gemm'
 
-    return nodes
\ No newline at end of file
+    return nodes
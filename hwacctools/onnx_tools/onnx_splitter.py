@@ -95,7 +95,8 @@ def split_qlinearconv_node_per_channel(graph, node, C_max, prefix="split"):
 def replace_qlinearconv_with_split(graph, node, new_nodes, new_inits, final_output):
     node_idx = None
     for idx, n in enumerate(graph.node):
-        if n == node:
+        # Identity, NodeProto == compares every field
+        if n is node:
             node_idx = idx
             break
     if node_idx is not None:
@@ -615,14 +616,11 @@ def topological_sort_onnx_graph(graph):
     from collections import defaultdict, deque
 
     # Build dependency graph
+    # Nodes are keyed on id(), node names can be empty or repeated
     input_to_nodes = defaultdict(list)
-    node_inputs = {}
-    all_inputs = set()
     for node in graph.node:
-        node_inputs[node.name] = set(node.input)
         for inp in node.input:
             input_to_nodes[inp].append(node)
-            all_inputs.add(inp)
 
     # Find all available tensors (graph inputs and initializers)
     available = set(inp.name for inp in graph.input)
@@ -633,8 +631,8 @@ def topological_sort_onnx_graph(graph):
     in_degree = {}
     for node in graph.node:
         missing = [inp for inp in node.input if inp not in available]
-        in_degree[node.name] = len(missing)
-        if in_degree[node.name] == 0:
+        in_degree[id(node)] = len(missing)
+        if in_degree[id(node)] == 0:
             ready.append(node)
 
     sorted_nodes = []
@@ -643,13 +641,13 @@ def topological_sort_onnx_graph(graph):
     while ready:
         node = ready.popleft()
         sorted_nodes.append(node)
-        visited.add(node.name)
+        visited.add(id(node))
         for out in node.output:
             for consumer in input_to_nodes.get(out, []):
-                if consumer.name in visited:
+                if id(consumer) in visited:
                     continue
-                in_degree[consumer.name] -= 1
-                if in_degree[consumer.name] == 0:
+                in_degree[id(consumer)] -= 1
+                if in_degree[id(consumer)] == 0:
                     ready.append(consumer)
 
     if len(sorted_nodes) != len(graph.node):
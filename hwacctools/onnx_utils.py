@@ -1,7 +1,7 @@
 import onnxruntime as ort
 import numpy as np
-from torchvision import transforms
-from PIL import Image
+import os
+import hashlib
 import onnx
 from onnx import helper, numpy_helper
 from typing import Sequence, Any
@@ -22,10 +22,51 @@ def add_tensor_to_model_outputs(model, tensor_name):
     model.graph.output.append(layer_value_info)
     return model
 
+# Sessions keyed on the optimization level and a digest of the serialized model
+_SESSION_CACHE = {}
+# Sessions for get_intermediate_tensor_value keyed on (modelpath, mtime, tensor_name, input names)
+_INTERMEDIATE_SESSION_CACHE = {}
+# Each session holds a copy of the model weights, keep only the most recent
+_SESSION_CACHE_SIZE = 8
+
+def _cache_get(cache, key):
+    """
+    Returns cache[key] or None, marking the entry as most recently used.
+    """
+    value = cache.pop(key, None)
+    if value is not None:
+        cache[key] = value
+    return value
+
+def _cache_put(cache, key, value, size):
+    """
+    Stores value in cache, evicting the least recently used entries so
+    that at most size entries remain.
+    """
+    cache.pop(key, None)
+    while len(cache) >= size:
+        del cache[next(iter(cache))]
+    cache[key] = value
+
+_SESSION_OPTIONS = ort.SessionOptions()
+_SESSION_OPTIONS.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+_SESSION_OPTIONS.intra_op_num_threads = os.cpu_count()
+
+# Intermediate tensors are read with nothing fused or folded away
+_REFERENCE_SESSION_OPTIONS = ort.SessionOptions()
+_REFERENCE_SESSION_OPTIONS.graph_optimization_level = ort.GraphOptimizationLevel.ORT_DISABLE_ALL
+_REFERENCE_SESSION_OPTIONS.intra_op_num_threads = os.cpu_count()
+
 def get_intermediate_tensor_value(modelpath, tensor_name, input_dict=None):
     """
     Get the value of an intermediate tensor from an ONNX model.
     Works on a copy of the model to preserve the original.
+
+    Only the part of the graph that tensor_name depends on is run. When
+    modelpath is a path, the session is cached so repeated queries with
+    the same input names skip the graph walk.
+    Tensors in input_dict and initializers are returned without running
+    the model.
     
     Args:
         modelpath: Path to the ONNX model or the model itself
@@ -35,115 +76,125 @@ def get_intermediate_tensor_value(modelpath, tensor_name, input_dict=None):
     Returns:
         The value of the specified tensor
     """
-    # Load model and create a copy
+    # Fed tensors and constants are already known, no need for a session
+    if tensor_name in input_dict:
+        return input_dict[tensor_name]
+
     if type(modelpath) == str:
-        original_model = onnx.load(modelpath)
+        cache_key = (modelpath, os.path.getmtime(modelpath), tensor_name, frozenset(input_dict))
+        session = _cache_get(_INTERMEDIATE_SESSION_CACHE, cache_key)
+        if session is None:
+            original_model = onnx.load(modelpath)
+            init = _find_initializer(original_model, tensor_name)
+            if init is not None:
+                return numpy_helper.to_array(init)
+            session = get_session(prune_model_for_tensor(original_model, tensor_name, input_dict),
+                                  _REFERENCE_SESSION_OPTIONS)
+            _cache_put(_INTERMEDIATE_SESSION_CACHE, cache_key, session, _SESSION_CACHE_SIZE)
     else:
-        original_model = modelpath
-    
-    # Create a deep copy of the model
-    model = onnx.ModelProto()
-    model.CopyFrom(original_model)
-    
-    # Create a new model with the specified tensor as output
-    model = add_tensor_to_model_outputs(model, tensor_name)
-
-    # Remove inputs from model that are not in input_dict
-    input_names = list(input_dict.keys())
-    model_inputs = list(model.graph.input)
-    for input_info in model_inputs:
-        if input_info.name not in input_names:
-            model.graph.input.remove(input_info)
-
-    model_outputs = list(model.graph.output)
-    for output_info in model_outputs:
-        if output_info.name != tensor_name:
-            model.graph.output.remove(output_info)
-
-    # Handle intermediate tensors as inputs
-    for input_tensor_name,input_tensor in input_dict.items():
-        if input_tensor_name not in [inp.name for inp in model.graph.input]:
-            # print(f'Input tensor {input_tensor_name} is not original input. Input tensor name provided:', input_tensor_name)
-            
-            # Rename node outputs that match input_tensor_name
-            for node in model.graph.node:
-                for i, output_name in enumerate(node.output):
-                    if output_name == input_tensor_name:
-                        new_output_name = f"{output_name}_original"
-                        node.output[i] = new_output_name
-                        # print(f"Renamed node output from {input_tensor_name} to {new_output_name}")
-            
-            # Add the intermediate tensor as a new input with proper type information
-            if hasattr(input_tensor, 'dtype'):
-                elem_type = onnx.helper.np_dtype_to_tensor_dtype(input_tensor.dtype)
-            else:
-                elem_type = onnx.TensorProto.UINT8
-            
-            input_info = helper.make_tensor_value_info(
-                name=input_tensor_name,
-                elem_type=elem_type,
-                shape = None
-            )
-            model.graph.input.append(input_info)
-    
-    # Remove nodes that are now unconnected to the main graph
-    used_inputs = set([inp.name for inp in model.graph.input])
-    used_outputs = set([out.name for out in model.graph.output])
-    original_outputs = set([out.name for out in model.graph.output])
-    obtained_outputs = set()
-
-    # Process nodes to find all connections
-    connected_nodes = []
-    changed = True
-    while changed:
-        changed = False
-        
-        if original_outputs.issubset(obtained_outputs):
-            break
+        init = _find_initializer(modelpath, tensor_name)
+        if init is not None:
+            return numpy_helper.to_array(init)
+        # get_session is keyed on the pruned model's contents, so edits to
+        # the model always get a fresh session
+        session = get_session(prune_model_for_tensor(modelpath, tensor_name, input_dict),
+                              _REFERENCE_SESSION_OPTIONS)
 
-        for node in model.graph.node:
-
-            if original_outputs.issubset(obtained_outputs):
-                break
-
-            if node in connected_nodes:
-                continue
-                
-            is_connected = False
-            for inp in node.input:
-                if inp in used_outputs or inp in used_inputs:
-                    is_connected = True
-                    obtained_outputs.update(node.output)
-                    break
-                    
-            if is_connected:
-                connected_nodes.append(node)
-                for out in node.output:
-                    used_outputs.add(out)
-                changed = True
-
-    # Create a new graph with only the connected nodes
-    new_nodes = [node for node in model.graph.node if node in connected_nodes]
-    model.graph.ClearField("node")
-    model.graph.node.extend(new_nodes)
-
-    # Keep only used initializers
-    used_initializers = set()
-    for node in model.graph.node:
-        used_initializers.update(node.input)
-    
-    new_initializers = [
-        init for init in model.graph.initializer 
-        if init.name in used_initializers or init.name in used_outputs
-    ]
-    
-    model.graph.ClearField("initializer")
-    model.graph.initializer.extend(new_initializers)
+    return session.run([tensor_name], input_dict)[0]
+
+def prune_model_for_tensor(original_model, tensor_name, input_dict):
+    """
+    Returns a new model whose only output is tensor_name, fed by the
+    tensors in input_dict. Only the nodes and initializers that
+    contribute to tensor_name are copied out of the original model.
+    """
+    graph = original_model.graph
+
+    # Walk back from the requested tensor, stopping at the provided inputs
+    nodes = graph.node
+    producers = {out: i for i, node in enumerate(nodes) for out in node.output}
+    kept_nodes = set()
+    used_tensors = set()
+    stack = [tensor_name]
+    while stack:
+        name = stack.pop()
+        if name in used_tensors:
+            continue
+        used_tensors.add(name)
+        if name in input_dict:
+            continue
+        i = producers.get(name)
+        if i is None or i in kept_nodes:
+            continue
+        kept_nodes.add(i)
+        stack.extend(nodes[i].input)
+
+    new_nodes = []
+    for i, node in enumerate(nodes):
+        if i not in kept_nodes:
+            continue
+        if any(out in input_dict for out in node.output):
+            # Node also produces a tensor we are feeding, rename that output
+            node_copy = onnx.NodeProto()
+            node_copy.CopyFrom(node)
+            for j, output_name in enumerate(node_copy.output):
+                if output_name in input_dict:
+                    node_copy.output[j] = f"{output_name}_original"
+            node = node_copy
+        new_nodes.append(node)
+
+    new_initializers = [init for init in graph.initializer if init.name in used_tensors]
+
+    # Keep original inputs that are fed, intermediate tensors become new inputs
+    new_inputs = [inp for inp in graph.input if inp.name in input_dict]
+    original_input_names = set(inp.name for inp in new_inputs)
+    for input_tensor_name, input_tensor in input_dict.items():
+        if input_tensor_name in original_input_names:
+            continue
+        if hasattr(input_tensor, 'dtype'):
+            elem_type = onnx.helper.np_dtype_to_tensor_dtype(input_tensor.dtype)
+        else:
+            elem_type = onnx.TensorProto.UINT8
+        new_inputs.append(helper.make_tensor_value_info(
+            name=input_tensor_name,
+            elem_type=elem_type,
+            shape = None
+        ))
+
+    output_info = helper.ValueInfoProto()
+    output_info.name = tensor_name
+
+    new_graph = helper.make_graph(
+        nodes=new_nodes,
+        name=graph.name,
+        inputs=new_inputs,
+        outputs=[output_info],
+        initializer=new_initializers,
+    )
+    model = helper.make_model(
+        new_graph,
+        opset_imports=original_model.opset_import,
+        functions=original_model.functions,
+    )
+    model.ir_version = original_model.ir_version
 
-    return infer(model, input_dict)[-1]
+    return model
+
+def get_session(nx_model, sess_options=_SESSION_OPTIONS):
+    """
+    Returns an InferenceSession for the model, reusing a previous one
+    if an identical model was already loaded with the same options.
+    """
+    serialized = nx_model.SerializeToString()
+    key = (sess_options.graph_optimization_level, hashlib.blake2b(serialized, digest_size=16).digest())
+    session = _cache_get(_SESSION_CACHE, key)
+    if session is None:
+        session = ort.InferenceSession(serialized, sess_options=sess_options)
+        _cache_put(_SESSION_CACHE, key, session, _SESSION_CACHE_SIZE)
+    return session
 
 def infer(nx_model, input_dict):
-    session = ort.InferenceSession(nx_model.SerializeToString())
+    session = get_session(nx_model)
     outputs = session.run(None, input_dict)
     return outputs
 
@@ -279,23 +330,53 @@ def infer_node_output(
     return results
     
 
-def is_initializer(onnx_model,name):
-    for init in onnx_model.graph.initializer:
-        if init.name == name:
-            return 'initializer'
-    return False
+def index_model(onnx_model):
+    """
+    Builds name lookup tables for a model. The tuple can be passed in place
+    of the model to is_initializer, get_initializer_by_name and
+    get_node_by_output when doing many lookups. It is not updated if the
+    model is edited afterwards.
 
-def get_initializer_by_name(onnx_model,name):
+    Returns:
+        ({initializer name: initializer}, {first node output: node})
+    """
+    # Reversed so that, as with a scan, the first of duplicate names wins
+    initializers = {init.name: init for init in reversed(onnx_model.graph.initializer)}
+    nodes = {node.output[0]: node for node in reversed(onnx_model.graph.node) if node.output}
+    return initializers, nodes
+
+def _find_initializer(onnx_model, name):
+    if isinstance(onnx_model, tuple):
+        return onnx_model[0].get(name)
     for init in onnx_model.graph.initializer:
         if init.name == name:
             return init
-    raise LookupError(f'Could not find initializer with name {name}')
+    return None
 
-def get_node_by_output(onnx_model,output_name):
+def _find_node(onnx_model, output_name):
+    if isinstance(onnx_model, tuple):
+        return onnx_model[1].get(output_name)
     for node in onnx_model.graph.node:
-        if node.output[0] == output_name:
+        if node.output and node.output[0] == output_name:
             return node
-    raise LookupError(f'Could not find node with output {output_name}')
+    return None
+
+def is_initializer(onnx_model,name):
+    if _find_initializer(onnx_model, name) is not None:
+        return 'initializer'
+    return False
+
+def get_initializer_by_name(onnx_model,name):
+    init = _find_initializer(onnx_model, name)
+    if init is None:
+        raise LookupError(f'Could not find initializer with name {name}')
+    return init
+
+def get_node_by_output(onnx_model,output_name):
+    node = _find_node(onnx_model, output_name)
+    if node is None:
+        raise LookupError(f'Could not find node with output {output_name}')
+    return node
 
 def get_attribute_by_name(name:str,attr_list:list):
     for i,attr in enumerate(attr_list):
@@ -311,27 +392,29 @@ def delete_initializer_by_name(model, initializer_name):
             break
 
 def randomize_initializer_to_binary(model, initializer_name):
-    array = numpy_helper.to_array(get_initializer_by_name(model, initializer_name))
-    new_value = np.random.randint(0, 2, size=array.shape).astype(array.dtype)
-    tensor = numpy_helper.from_array(new_value, name=initializer_name)
-    delete_initializer_by_name(model, initializer_name)
-    model.graph.initializer.append(tensor)
+    init = get_initializer_by_name(model, initializer_name)
+    dtype = helper.tensor_dtype_to_np_dtype(init.data_type)
+    new_value = np.random.randint(0, 2, size=tuple(init.dims), dtype=np.uint8).astype(dtype, copy=False)
+
+    # Overwrite the tensor contents in place
+    for field in ('float_data', 'int32_data', 'int64_data', 'double_data', 'uint64_data'):
+        init.ClearField(field)
+    init.raw_data = new_value.tobytes()
 
 def randomize_model_to_binary_weights(model):
+    # Only values change, so one index serves every lookup
+    index = index_model(model)
     for i,node in enumerate(model.graph.node):
         if node.op_type == 'QLinearConv':
             group = get_attribute_by_name('group', node.attribute).i
             if(group == 1):
                 inii = node.input[3]
-                randomize_initializer_to_binary(model, inii)
+                randomize_initializer_to_binary(index, inii)
         if node.op_type == 'QLinearMatMul':
             inii = node.input[3]
-            randomize_initializer_to_binary(model, inii)
+            randomize_initializer_to_binary(index, inii)
     return model
 
-import onnx
-from onnx import helper, numpy_helper
-
 def make_single_node_model(nx_node, initializer_dict, input_names, output_names):
     """
     Create an ONNX ModelProto with a single node and a set of initializers.
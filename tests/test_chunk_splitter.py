@@ -0,0 +1,48 @@
+import numpy as np
+import pytest
+from hwacctools.comp_graph import cnodes, cgraph, splitter
+
+def run_split(nodes, x):
+    split_cgraph = cgraph.Cgraph(nodes)
+    split_cgraph.forward({'x': x}, progbar=False)
+    return np.squeeze(split_cgraph.edges['y'])
+
+@pytest.mark.parametrize("channel_minor", [False, True])
+def test_split_conv_into_chunks(channel_minor):
+    rng = np.random.default_rng(0)
+    kernel = rng.integers(-3, 4, (40, 30, 3, 3))
+    biases = rng.integers(-5, 5, 40)
+    x = rng.integers(0, 10, (1, 30, 8, 8))
+    conv = cnodes.conv_node(['x'], ['y'], kernel, biases, channel_minor=channel_minor, zero_point=2)
+
+    nodes = splitter.split_conv_into_chunks(conv, 64, 16)
+
+    assert len(nodes) > 1
+    assert np.allclose(run_split(nodes, x), np.squeeze(conv.forward([x])))
+
+@pytest.mark.parametrize("strides", [1, 2])
+def test_split_dwc_into_chunks(strides):
+    rng = np.random.default_rng(0)
+    kernel = rng.integers(-3, 4, (10, 1, 3, 3))
+    biases = rng.integers(-5, 5, 10)
+    x = rng.integers(0, 10, (1, 10, 6, 6))
+    dwc = cnodes.dwc_node(['x'], ['y'], kernel, biases, strides=strides, channel_minor=True, zero_point=3)
+
+    nodes = splitter.split_dwc_into_chunks(dwc, 4)
+
+    assert sum(type(node) == cnodes.gemm_node for node in nodes) == 3
+    assert np.allclose(run_split(nodes, x), dwc.forward([x]))
+
+@pytest.mark.parametrize("rows", [20, 32, 70])
+@pytest.mark.parametrize("cols", [30, 32])
+def test_split_gemm_into_chunks(rows, cols):
+    rng = np.random.default_rng(0)
+    matrix = rng.integers(-3, 4, (rows, cols))
+    biases = rng.integers(-5, 5, cols)
+    x = rng.integers(0, 10, (1, rows))
+    gemm = cnodes.gemm_node(['x'], ['y'], matrix, biases)
+
+    nodes = splitter.split_gemm_into_chunks(gemm, 32, 8)
+
+    assert len(nodes) > 1
+    assert np.array_equal(run_split(nodes, x), np.squeeze(gemm.forward([x])))
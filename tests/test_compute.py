@@ -0,0 +1,58 @@
+import numpy as np
+import pytest
+from hwacctools.comp_graph.compute import toeplitzize_input
+
+def reference_toeplitz(x, strides, channel_minor, zero_point):
+    # Naive per-pixel 3x3 im2col on a C,H,W tensor with 1-pixel padding
+    padded = np.pad(x, ((0,0),(1,1),(1,1)), constant_values=zero_point)
+    H = (x.shape[1] - 1) // strides + 1
+    W = (x.shape[2] - 1) // strides + 1
+    rows = []
+    for r in range(H):
+        for c in range(W):
+            field = padded[:, r*strides:r*strides+3, c*strides:c*strides+3]
+            if channel_minor:
+                field = field.transpose(1,2,0)
+            rows.append(field.flatten())
+    return np.array(rows, dtype=x.dtype)
+
+@pytest.mark.parametrize("shape", [(1,5,5),(3,8,8),(4,7,9)])
+@pytest.mark.parametrize("strides", [1,2])
+@pytest.mark.parametrize("channel_minor", [False,True])
+@pytest.mark.parametrize("dtype", [np.uint8, np.int32])
+def test_toeplitzize_k3(shape, strides, channel_minor, dtype):
+    x = np.random.default_rng(0).integers(0, 255, shape).astype(dtype)
+    out = toeplitzize_input(x, ksize=3, strides=strides, channel_minor=channel_minor, zero_point=7)
+    ref = reference_toeplitz(x, strides, channel_minor, 7)
+    assert out.dtype == x.dtype
+    assert (out == ref).all()
+
+def test_toeplitzize_k1():
+    x = np.arange(4*6*6).reshape(4,6,6)
+    out = toeplitzize_input(x, ksize=1, strides=2)
+    assert (out == x[:, ::2, ::2].reshape(4,-1).T).all()
+
+@pytest.mark.parametrize("dtype", [np.uint8, np.int8])
+def test_toeplitzize_keeps_narrow_dtype(dtype):
+    x = np.random.default_rng(0).integers(0, 100, (8,10,10)).astype(dtype)
+    zero_point = np.array(5, dtype=np.int32)
+    out = toeplitzize_input(x, ksize=3, zero_point=zero_point)
+    assert out.dtype == dtype
+    assert (out == reference_toeplitz(x, 1, False, 5)).all()
+
+@pytest.mark.parametrize("ksize", [5,7])
+@pytest.mark.parametrize("channel_minor", [False,True])
+def test_toeplitzize_large_kernels(ksize, channel_minor):
+    x = np.random.default_rng(0).integers(0, 255, (3,9,10)).astype(np.uint8)
+    p = ksize // 2
+    out = toeplitzize_input(x, ksize=ksize, strides=2, channel_minor=channel_minor, zero_point=4, pads=(p,p,p,p))
+    padded = np.pad(x, ((0,0),(p,p),(p,p)), constant_values=4)
+    fields = [padded[:, r:r+ksize, c:c+ksize] for r in range(0,9,2) for c in range(0,10,2)]
+    if channel_minor:
+        fields = [f.transpose(1,2,0) for f in fields]
+    assert (out == np.array([f.flatten() for f in fields])).all()
+
+def test_toeplitzize_empty_output():
+    x = np.zeros((4,5,2), dtype=np.uint8)
+    out = toeplitzize_input(x, ksize=3, pads=(0,0,0,0))
+    assert out.shape == (0, 4*9)
@@ -0,0 +1,87 @@
+import os
+import numpy as np
+import onnx
+from onnx import helper, numpy_helper, TensorProto
+from hwacctools import onnx_utils
+
+def make_model(w=(1.,-5.)):
+    # T = X + W, U = Relu(T), Y = U * X, and Z = Relu(B) on a second input
+    nodes = [
+        helper.make_node('Add', ['X','W'], ['T']),
+        helper.make_node('Relu', ['T'], ['U']),
+        helper.make_node('Mul', ['U','X'], ['Y']),
+        helper.make_node('Relu', ['B'], ['Z']),
+    ]
+    graph = helper.make_graph(
+        nodes, 'g',
+        inputs=[helper.make_tensor_value_info(name, TensorProto.FLOAT, [2]) for name in ('X','B')],
+        outputs=[helper.make_tensor_value_info(name, TensorProto.FLOAT, [2]) for name in ('Y','Z')],
+        initializer=[numpy_helper.from_array(np.array(w,dtype=np.float32),'W')],
+    )
+    model = helper.make_model(graph, opset_imports=[helper.make_operatorsetid('',13)])
+    model.ir_version = 8
+    return model
+
+X = np.array([2.,3.], dtype=np.float32)
+B = np.array([-1.,4.], dtype=np.float32)
+
+def test_lookups_see_in_place_edits():
+    m = make_model()
+    assert onnx_utils.is_initializer(m, 'W')
+    assert onnx_utils.get_node_by_output(m, 'T').op_type == 'Add'
+
+    m.graph.initializer[0].name = 'renamed'
+    assert onnx_utils.get_initializer_by_name(m, 'renamed') is m.graph.initializer[0]
+    assert not onnx_utils.is_initializer(m, 'W')
+
+    m.graph.initializer[0].CopyFrom(numpy_helper.from_array(np.zeros(2,dtype=np.float32),'fresh'))
+    assert onnx_utils.is_initializer(m, 'fresh')
+
+    m.graph.node[0].output[0] = 'newout'
+    assert onnx_utils.get_node_by_output(m, 'newout').op_type == 'Add'
+
+def test_intermediate_from_graph_inputs():
+    out = onnx_utils.get_intermediate_tensor_value(make_model(), 'U', {'X': X, 'B': B})
+    assert np.array_equal(out, [3.,0.])
+
+def test_intermediate_from_partial_graph_inputs():
+    m = make_model()
+    assert np.array_equal(onnx_utils.get_intermediate_tensor_value(m, 'Y', {'X': X}), [6.,0.])
+    assert np.array_equal(onnx_utils.get_intermediate_tensor_value(m, 'Z', {'B': B}), [0.,4.])
+
+def test_intermediate_fed_as_input():
+    T = np.array([-1.,7.], dtype=np.float32)
+    assert np.array_equal(onnx_utils.get_intermediate_tensor_value(make_model(), 'U', {'T': T}), [0.,7.])
+
+def test_graph_input_and_intermediate_fed_together():
+    U = np.array([5.,1.], dtype=np.float32)
+    assert np.array_equal(onnx_utils.get_intermediate_tensor_value(make_model(), 'Y', {'X': X, 'U': U}), [10.,3.])
+
+def test_fed_tensors_and_initializers_returned_directly():
+    m = make_model()
+    assert onnx_utils.get_intermediate_tensor_value(m, 'X', {'X': X}) is X
+    assert np.array_equal(onnx_utils.get_intermediate_tensor_value(m, 'W', {'X': X}), [1.,-5.])
+
+def test_cached_session_follows_model_file(tmp_path):
+    path = str(tmp_path / 'model.onnx')
+    onnx.save(make_model(), path)
+    assert np.array_equal(onnx_utils.get_intermediate_tensor_value(path, 'U', {'X': X}), [3.,0.])
+
+    onnx.save(make_model(w=(-5.,1.)), path)
+    mtime = os.path.getmtime(path) + 10
+    os.utime(path, (mtime, mtime))
+    assert np.array_equal(onnx_utils.get_intermediate_tensor_value(path, 'U', {'X': X}), [0.,4.])
+
+def test_cached_session_follows_model_edits():
+    m = make_model()
+    assert np.array_equal(onnx_utils.get_intermediate_tensor_value(m, 'U', {'X': X}), [3.,0.])
+    m.graph.initializer[0].CopyFrom(numpy_helper.from_array(np.array([-5.,1.],dtype=np.float32),'W'))
+    assert np.array_equal(onnx_utils.get_intermediate_tensor_value(m, 'U', {'X': X}), [0.,4.])
+
+def test_lookups_through_index():
+    m = make_model()
+    index = onnx_utils.index_model(m)
+    assert onnx_utils.is_initializer(index, 'W')
+    assert not onnx_utils.is_initializer(index, 'T')
+    assert onnx_utils.get_initializer_by_name(index, 'W') is m.graph.initializer[0]
+    assert onnx_utils.get_node_by_output(index, 'Y').op_type == 'Mul'